@@ -17,7 +17,8 @@
 # ---------------------------
 try:
     import audioop  # noqa: F401
-except Exception:
+except ImportError:
+    # Only hosts without audioop (removed from the stdlib in 3.13) get the stub
     import sys, types
     _fake_audioop = types.ModuleType("audioop")
     def _audioop_error(*a, **k):
@@ -34,14 +35,20 @@ except Exception:
 # ---------------------------
 import os
 import asyncio
+import logging
+import logging.handlers
+import queue
+import sqlite3
+import io
 import json
 import random
+import re
 import math
 import time
-import traceback
-from collections import defaultdict, deque
-from datetime import datetime, timedelta, timezone
-from typing import Dict, Optional, List, Any
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from functools import partial
+from typing import Dict, Optional, List, Any, Tuple
 
 import aiohttp
 from aiohttp import ClientTimeout, web
@@ -57,6 +64,22 @@ try:
 except Exception:
     pass
 
+# ---------------------------
+# Logging
+# ---------------------------
+# Handlers only enqueue records; the listener thread does the (blocking) stdout writes
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_log_stream = logging.StreamHandler()
+_log_stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_stream)
+# Attached directly (not via basicConfig, which would give it a formatter of its own
+# and format every record twice: once when enqueued, again by _log_stream)
+_root_log = logging.getLogger()
+_root_log.addHandler(logging.handlers.QueueHandler(_log_queue))
+_root_log.setLevel(logging.INFO)
+_log_listener.start()
+log = logging.getLogger("raid_preventor")
+
 # ---------------------------
 # Configuration
 # ---------------------------
@@ -78,10 +101,26 @@ except Exception:
 SCAN_INTERVAL = int(os.getenv("SCAN_INTERVAL", "30"))
 RAID_WINDOW_SECONDS = int(os.getenv("RAID_WINDOW_SECONDS", "60"))
 RAID_THRESHOLD_JOINS = int(os.getenv("RAID_THRESHOLD_JOINS", "5"))
+RAID_KICK_CONCURRENCY = int(os.getenv("RAID_KICK_CONCURRENCY", "10"))
+REST_CONCURRENCY = int(os.getenv("REST_CONCURRENCY", "40"))  # stays under Discord's 50 req/s global limit
+JOIN_LOG_MAXLEN = max(RAID_THRESHOLD_JOINS * 4, 16)
 
 PORT = int(os.getenv("PORT", os.getenv("KEEPALIVE_PORT", "6534")))
 
+INVITE_SNAPSHOT_TTL = float(os.getenv("INVITE_SNAPSHOT_TTL", "2.0"))
+GUILD_REFRESH_CONCURRENCY = int(os.getenv("GUILD_REFRESH_CONCURRENCY", "10"))
+
+# Relative to the working directory. On Heroku/Render-style hosts (see Procfile) that
+# filesystem is wiped on every restart and deploy, so point this at a persistent disk
+# or alt-detection state won't survive.
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "raid_state.db")
+DB_FLUSH_DELAY = float(os.getenv("DB_FLUSH_DELAY", "0.5"))
+
+MAX_TRACKED_MEMBERS_PER_GUILD = int(os.getenv("MAX_TRACKED_MEMBERS_PER_GUILD", "20000"))
+FLAGGED_TTL_DAYS = int(os.getenv("FLAGGED_TTL_DAYS", "30"))
+
 JOIN_WARNING_MAX_CHANNELS = int(os.getenv("JOIN_WARNING_MAX_CHANNELS", "6"))
+ALERT_BROADCAST = os.getenv("ALERT_BROADCAST", "false").lower() in ("1", "true", "yes")
 
 MEME_API_URL = os.getenv("MEME_API_URL", "https://meme-api.com/gimme")
 LIBRETRANSLATE_URL = os.getenv("LIBRETRANSLATE_URL", "https://libretranslate.com/translate")
@@ -105,6 +144,15 @@ if DM_LOG_CHANNELS_JSON:
 else:
     DM_LOG_CHANNELS = {}
 
+ALERT_CHANNELS_JSON = os.getenv("ALERT_CHANNELS_JSON", "")
+if ALERT_CHANNELS_JSON:
+    try:
+        ALERT_CHANNELS = {int(k): int(v) for k, v in json.loads(ALERT_CHANNELS_JSON).items()}
+    except Exception:
+        ALERT_CHANNELS = {}
+else:
+    ALERT_CHANNELS = {}
+
 FORWARD_TO_OWNER_DM = os.getenv("FORWARD_TO_OWNER_DM", "true").lower() in ("1", "true", "yes")
 
 MAX_ROLL_COUNT = int(os.getenv("MAX_ROLL_COUNT", "100"))
@@ -120,19 +168,168 @@ intents = discord.Intents.default()
 intents.guilds = True
 intents.members = True
 intents.message_content = True  # required to read DM contents; enable in dev portal
-
-bot = commands.Bot(command_prefix="!", intents=intents)
+# Nothing listens to these; disabling them stops Discord sending the events at all
+intents.voice_states = False
+intents.typing = False
+intents.presences = False
+intents.guild_messages = False  # only DMs are read (forwarding); there are no prefix commands
+
+# Only cache members that join while we're connected (the ones raid/alt handling looks up)
+# and skip chunking every guild's full member list at startup.
+member_cache_flags = discord.MemberCacheFlags.none()
+member_cache_flags.joined = True
+
+bot = commands.Bot(
+    command_prefix="!",
+    intents=intents,
+    member_cache_flags=member_cache_flags,
+    chunk_guilds_at_startup=False,
+)
 tree = bot.tree
 
 # ---------------------------
 # Runtime state
 # ---------------------------
-join_log: Dict[int, deque] = defaultdict(lambda: deque(maxlen=2000))
-invite_cache: Dict[int, Dict[str, int]] = defaultdict(dict)
-member_inviter: Dict[int, Dict[int, Optional[int]]] = defaultdict(dict)
-inviter_index: Dict[int, set] = defaultdict(set)
-banned_inviters: Dict[int, set] = defaultdict(set)
-flagged_accounts: Dict[int, Dict[int, str]] = defaultdict(dict)
+class LRUDict(OrderedDict):
+    """OrderedDict that drops its least-recently-written entry once it holds more than `cap` items."""
+
+    def __init__(self, cap: int = MAX_TRACKED_MEMBERS_PER_GUILD, on_evict=None):
+        super().__init__()
+        self.cap = cap
+        self.on_evict = on_evict
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.cap:
+            old_key, old_value = self.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(old_key, old_value)
+
+# Plain dicts: per-guild containers are created explicitly on first write,
+# so lookups on the hot paths are a single dict.get with no factory call.
+join_log: Dict[int, deque] = {}
+invite_cache: Dict[int, Dict[str, int]] = {}
+member_inviter: Dict[int, Dict[int, Optional[int]]] = {}
+inviter_index: Dict[Tuple[int, int], set] = {}  # (guild, inviter) -> invited member IDs
+banned_inviters: Dict[int, set] = {}
+flagged_accounts: Dict[int, Dict[int, Tuple[float, str]]] = {}  # member -> (flagged at, reason)
+
+# Shared invite snapshots so a burst of joins costs one guild.invites() call
+_invite_fetch_locks: Dict[int, asyncio.Lock] = {}
+_invite_fetch_cache: Dict[int, Tuple[float, List[discord.Invite]]] = {}
+_invite_pending_joins: Dict[int, int] = {}
+
+_raid_locks: Dict[int, asyncio.Lock] = {}
+
+def guild_lock(locks: Dict[int, asyncio.Lock], guild_id: int) -> asyncio.Lock:
+    lock = locks.get(guild_id)
+    if lock is None:
+        lock = locks[guild_id] = asyncio.Lock()
+    return lock
+
+# Alerts and forwards carry user-controlled text; never let it ping anyone
+_NO_MENTIONS = discord.AllowedMentions.none()
+
+# Shared by every fan-out (kicks, alerts, DMs) so a raid can't trip the global rate limit
+REST_GATE = asyncio.Semaphore(REST_CONCURRENCY)
+
+# One pooled client for outbound HTTP (meme/translate); opened in main(), closed on exit
+HTTP: Optional[aiohttp.ClientSession] = None
+
+# Text channel IDs the bot can post in, per guild; filled lazily, dropped on channel/role changes
+sendable_channels: Dict[int, List[int]] = {}
+
+# Resolved once and reused by every owner alert; cleared if a send says the user is gone
+BOT_OWNER_USER: Optional[discord.User] = None
+# Guild owners fetched for flag alerts, keyed by guild; re-fetched if ownership changes
+_guild_owners: Dict[int, discord.User] = {}
+
+# ---------------------------
+# Persistence (SQLite, WAL) for alt-detection state
+# ---------------------------
+_db: Optional[sqlite3.Connection] = None
+# Writes queue here and commit together, so a raid costs one transaction per flush, not per join
+_db_pending: List[Tuple[str, tuple]] = []
+_db_flush_handle: Optional[asyncio.TimerHandle] = None
+
+def db_open():
+    global _db
+    _db = sqlite3.connect(STATE_DB_PATH, isolation_level=None)
+    _db.execute("PRAGMA journal_mode=WAL")
+    _db.execute("PRAGMA synchronous=NORMAL")  # durable under WAL; skips the fsync per commit
+    _db.execute("CREATE TABLE IF NOT EXISTS banned (guild INTEGER, user INTEGER, PRIMARY KEY (guild, user))")
+    _db.execute("CREATE TABLE IF NOT EXISTS inviter (guild INTEGER, member INTEGER, inviter INTEGER, PRIMARY KEY (guild, member))")
+    _db.execute("CREATE TABLE IF NOT EXISTS flagged (guild INTEGER, member INTEGER, reason TEXT, ts REAL, PRIMARY KEY (guild, member))")
+
+def db_write(sql: str, params: tuple = ()):
+    global _db_flush_handle
+    if _db is None:
+        return
+    _db_pending.append((sql, params))
+    if _db_flush_handle is not None:
+        return
+    # Every caller (including load_persisted_state, via main()) runs on the event loop
+    _db_flush_handle = asyncio.get_running_loop().call_later(DB_FLUSH_DELAY, db_flush)
+
+def db_flush():
+    global _db_flush_handle
+    _db_flush_handle = None
+    if _db is None or not _db_pending:
+        return
+    batch = _db_pending[:]
+    _db_pending.clear()
+    try:
+        _db.execute("BEGIN")
+        for sql, params in batch:
+            try:
+                _db.execute(sql, params)
+            except sqlite3.Error as e:
+                log.error("[DB] Write failed: %s", e)
+        _db.execute("COMMIT")
+    except sqlite3.Error as e:
+        log.error("[DB] Flush of %s writes failed: %s", len(batch), e)
+        try:
+            _db.execute("ROLLBACK")
+        except sqlite3.Error:
+            pass
+
+def unindex_invitee(guild_id: int, member_id: int, inviter_id: Optional[int]):
+    if not inviter_id:
+        return
+    key = (guild_id, inviter_id)
+    invited = inviter_index.get(key)
+    if invited is not None:
+        invited.discard(member_id)
+        if not invited:
+            del inviter_index[key]
+
+def forget_tracked_join(guild_id: int, member_id: int, inviter_id: Optional[int]):
+    """LRU eviction hook for member_inviter: keep inviter_index and the DB in step."""
+    unindex_invitee(guild_id, member_id, inviter_id)
+    db_write("DELETE FROM inviter WHERE guild = ? AND member = ?", (guild_id, member_id))
+
+def load_persisted_state():
+    if _db is None:
+        return
+    for gid, uid in _db.execute("SELECT guild, user FROM banned"):
+        banned_inviters.setdefault(gid, set()).add(uid)
+    # fetchall: over-cap rows are deleted as they evict, which must not race the open cursor
+    for gid, mid, inviter in _db.execute("SELECT guild, member, inviter FROM inviter ORDER BY rowid").fetchall():
+        inviters = member_inviter.get(gid)
+        if inviters is None:
+            inviters = member_inviter[gid] = LRUDict(on_evict=partial(forget_tracked_join, gid))
+        inviters[mid] = inviter
+        if inviter:
+            inviter_index.setdefault((gid, inviter), set()).add(mid)
+    for gid, mid, reason, ts in _db.execute("SELECT guild, member, reason, ts FROM flagged ORDER BY rowid"):
+        flagged = flagged_accounts.get(gid)
+        if flagged is None:
+            flagged = flagged_accounts[gid] = LRUDict()
+        flagged[mid] = (ts, reason)
+    log.info("[DB] Loaded state from %s: %s banned inviters, %s tracked joins, %s flagged",
+             STATE_DB_PATH, sum(map(len, banned_inviters.values())),
+             sum(map(len, member_inviter.values())), sum(map(len, flagged_accounts.values())))
 
 # ---------------------------
 # Keep-alive web server
@@ -140,68 +337,117 @@ flagged_accounts: Dict[int, Dict[int, str]] = defaultdict(dict)
 async def keepalive_handle(request):
     return web.Response(text="Raid Preventor Bot — alive")
 
+_keepalive_runner: Optional[web.AppRunner] = None
+
 async def start_keepalive():
+    # on_ready fires again after reconnects; the site only needs binding once
+    global _keepalive_runner
+    if _keepalive_runner is not None:
+        return
     app = web.Application()
     app.router.add_get("/", keepalive_handle)
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, "0.0.0.0", PORT)
     await site.start()
-    print(f"[KEEPALIVE] Listening on port {PORT}")
+    _keepalive_runner = runner
+    log.info("[KEEPALIVE] Listening on port %s", PORT)
 
 # ---------------------------
 # Utilities
 # ---------------------------
-def now_utc() -> datetime:
-    return datetime.now(UTC)
-
 def human_ts(dt: Optional[datetime]) -> str:
     if not dt:
         return "Unknown"
     return dt.astimezone(UTC).strftime("%Y-%m-%d %H:%M:%S UTC")
 
-def safe_print(*args, **kwargs):
+async def get_bot_owner() -> Optional[discord.User]:
+    global BOT_OWNER_USER
+    if BOT_OWNER_USER is None:
+        try:
+            BOT_OWNER_USER = bot.get_user(BOT_OWNER_ID) or await bot.fetch_user(BOT_OWNER_ID)
+        except discord.HTTPException as e:
+            log.warning("[OWNER] Could not fetch bot owner %s: %s", BOT_OWNER_ID, e)
+    return BOT_OWNER_USER
+
+async def send_to_bot_owner(text: str) -> bool:
+    global BOT_OWNER_USER
+    owner = await get_bot_owner()
+    if owner is None:
+        return False
     try:
-        print(*args, **kwargs)
+        await owner.send(text, allowed_mentions=_NO_MENTIONS)
+        return True
+    except discord.NotFound:
+        BOT_OWNER_USER = None
     except Exception:
         pass
+    return False
 
-def chunk_text(lines: List[str], limit: int = 1900) -> List[str]:
-    out = []
-    buf = ""
-    for line in lines:
-        if len(buf) + len(line) + 1 > limit:
-            out.append(buf)
-            buf = line
-        else:
-            buf = (buf + "\n" + line) if buf else line
-    if buf:
-        out.append(buf)
-    return out
+async def _rl(coro):
+    """
+    Await `coro` under the global REST_GATE. Wrap the REST call itself, inside any local
+    semaphore, so queued work doesn't sit on a global slot while waiting for a local one.
+    """
+    async with REST_GATE:
+        return await coro
 
-async def fetch_guild_invites_safe(guild: discord.Guild) -> List[discord.Invite]:
+async def fetch_guild_invites_safe(guild: discord.Guild) -> Optional[List[discord.Invite]]:
+    # None, not []: an empty snapshot would read as "every invite was deleted" and wipe the baseline
     try:
         return await guild.invites()
     except discord.Forbidden:
-        return []
-    except Exception:
-        return []
+        return None
+    except Exception as e:
+        log.warning("[INVITES] Fetch failed for %s: %s", guild.name, e)
+        return None
 
-async def broadcast_to_some_channels(guild: discord.Guild, message: str, max_channels: int = JOIN_WARNING_MAX_CHANNELS):
-    sent = 0
-    for ch in guild.text_channels:
-        if sent >= max_channels:
-            break
-        try:
-            perms = ch.permissions_for(guild.me)
+async def send_guild_alert(guild: discord.Guild, message: str, max_channels: int = JOIN_WARNING_MAX_CHANNELS):
+    """
+    Post `message` once: to the configured alert channel, else the system channel,
+    else the first channel we can write to. With ALERT_BROADCAST on, anything but a
+    configured alert channel fans out to up to `max_channels` channels instead.
+    """
+    me = guild.me
+    preferred = [guild.get_channel(ALERT_CHANNELS.get(guild.id, 0))]
+    if not ALERT_BROADCAST:
+        preferred.append(guild.system_channel)
+    for ch in preferred:
+        if ch is not None and ch.permissions_for(me).send_messages:
+            try:
+                await ch.send(message, allowed_mentions=_NO_MENTIONS)
+                return
+            except Exception as e:
+                log.warning("[WARN] Alert send failed in #%s (%s): %s", ch.name, guild.name, e)
+    if not ALERT_BROADCAST:
+        max_channels = 1
+    targets = [ch for ch in map(guild.get_channel, get_sendable_channel_ids(guild)[:max_channels]) if ch]
+    sem = asyncio.Semaphore(5)
+
+    async def _send(ch: discord.TextChannel) -> bool:
+        async with sem:
+            try:
+                await _rl(ch.send(message, allowed_mentions=_NO_MENTIONS))
+                return True
+            except Exception as e:
+                log.warning("[WARN] Send failed in #%s (%s): %s", ch.name, guild.name, e)
+                return False
+
+    results = await asyncio.gather(*(_send(ch) for ch in targets), return_exceptions=True)
+    if not any(r is True for r in results):
+        log.warning("[WARN] Cannot send warning to any channel in %s (%s)", guild.name, guild.id)
+
+def get_sendable_channel_ids(guild: discord.Guild) -> List[int]:
+    ids = sendable_channels.get(guild.id)
+    if ids is None:
+        me = guild.me
+        ids = []
+        for ch in guild.text_channels:
+            perms = ch.permissions_for(me)
             if perms.view_channel and perms.send_messages:
-                await ch.send(message)
-                sent += 1
-                await asyncio.sleep(0.12)
-        except Exception:
-            continue
-    if sent == 0:
-        safe_print(f"[WARN] Cannot send warning to any channel in {guild.name} ({guild.id})")
+                ids.append(ch.id)
+        sendable_channels[guild.id] = ids
+    return ids
 
 # ---------------------------
 # Role helpers
@@ -216,12 +462,12 @@ async def ensure_helper_role_present(guild: discord.Guild) -> Optional[discord.R
                 colour=discord.Colour.default(),
                 reason="Auto-created by Raid Preventor Bot"
             )
-            safe_print(f"[ROLE] Created helper in {guild.name}")
+            log.info("[ROLE] Created helper in %s", guild.name)
         except discord.Forbidden:
-            safe_print(f"[ROLE] Forbidden creating helper in {guild.name}")
+            log.warning("[ROLE] Forbidden creating helper in %s", guild.name)
             return None
         except Exception as e:
-            safe_print(f"[ROLE] Error creating helper in {guild.name}: {e}")
+            log.error("[ROLE] Error creating helper in %s: %s", guild.name, e)
             return None
     else:
         try:
@@ -240,11 +486,11 @@ async def move_role_as_high_as_possible(guild: discord.Guild, role: discord.Role
         target_pos = max(bot_top_pos - 1, 1)
         if role.position != target_pos:
             await role.edit(position=target_pos, reason="Place helper high (bot enforcement)")
-            safe_print(f"[ROLE] Moved {role.name} to pos {target_pos} in {guild.name}")
+            log.info("[ROLE] Moved %s to pos %s in %s", role.name, target_pos, guild.name)
     except discord.Forbidden:
-        safe_print(f"[ROLE] Forbidden move in {guild.name}")
+        log.warning("[ROLE] Forbidden move in %s", guild.name)
     except Exception as e:
-        safe_print(f"[ROLE] Error move in {guild.name}: {e}")
+        log.error("[ROLE] Error move in %s: %s", guild.name, e)
 
 async def assign_role_safe(member: discord.Member, role: discord.Role, reason: str = "") -> bool:
     try:
@@ -265,158 +511,362 @@ async def attempt_dataset_role_or_fallback(guild: discord.Guild, member: discord
             if ok:
                 return
             else:
-                safe_print(f"[FALLBACK] Cannot assign dataset role {desired_role_id} in {guild.name}")
+                log.warning("[FALLBACK] Cannot assign dataset role %s in %s", desired_role_id, guild.name)
         else:
-            safe_print(f"[FALLBACK] Dataset role id {desired_role_id} not found in {guild.name}")
+            log.warning("[FALLBACK] Dataset role id %s not found in %s", desired_role_id, guild.name)
     helper = await ensure_helper_role_present(guild)
     if helper:
         await move_role_as_high_as_possible(guild, helper)
         await assign_role_safe(member, helper, reason="Fallback helper assignment")
     else:
-        safe_print(f"[FALLBACK] Helper unavailable in {guild.name}")
+        log.warning("[FALLBACK] Helper unavailable in %s", guild.name)
 
 # ---------------------------
 # Invite tracking
 # ---------------------------
 async def cache_invites_for_guild(guild: discord.Guild):
-    try:
-        invites = await guild.invites()
-    except discord.Forbidden:
-        invite_cache[guild.id] = {}
-        return
-    except Exception:
-        invite_cache[guild.id] = {}
+    invites = await fetch_guild_invites_safe(guild)
+    if invites is None:
+        # No baseline rather than an empty one, so detection seeds it instead of guessing
+        invite_cache.pop(guild.id, None)
         return
     cache = {}
     for inv in invites:
         cache[inv.code] = inv.uses or 0
     invite_cache[guild.id] = cache
-    safe_print(f"[INVITES] Cached {len(cache)} invites for {guild.name}")
+    log.debug("[INVITES] Cached %s invites for %s", len(cache), guild.name)
+
+async def cache_bans_for_guild(guild: discord.Guild):
+    # The guild's ban list is authoritative: it adds bans that predate this process and
+    # drops persisted ones that were lifted while we were offline
+    before = set(banned_inviters.get(guild.id, ()))
+    try:
+        ids = {entry.user.id async for entry in guild.bans(limit=None)}
+    except discord.Forbidden:
+        return
+    except Exception as e:
+        log.warning("[BANS] Could not fetch bans for %s: %s", guild.name, e)
+        return
+    # Keep bans recorded by on_member_ban while the pages were being fetched
+    current = banned_inviters.get(guild.id, set())
+    ids |= current - before
+    for uid in before - ids:
+        db_write("DELETE FROM banned WHERE guild = ? AND user = ?", (guild.id, uid))
+    banned_inviters[guild.id] = ids
+    log.debug("[BANS] Cached %s bans for %s", len(ids), guild.name)
+
+def mark_invite_snapshot_dirty(guild_id: int):
+    # The shared snapshot no longer lists the right codes; the next join fetches a fresh one.
+    # invite_cache itself needs no refetch: unseen codes diff against 0, and stale codes
+    # are dropped at the next resync.
+    _invite_fetch_cache.pop(guild_id, None)
+
+def _first_unattributed_invite(invites: List[discord.Invite], baseline: Dict[str, int]) -> Optional[discord.Invite]:
+    return next((inv for inv in invites if (inv.uses or 0) > baseline.get(inv.code, 0)), None)
 
 async def detect_used_invite_and_record_inviter(member: discord.Member) -> Optional[int]:
+    """
+    Work out which invite `member` used by diffing a fresh invite snapshot against
+    invite_cache, which holds the uses already attributed to earlier joins.
+    Concurrent joins in the same guild queue on a per-guild lock and share one
+    snapshot while it is younger than INVITE_SNAPSHOT_TTL and still shows uses
+    that no join has claimed yet; otherwise a new snapshot is fetched.
+    """
     guild = member.guild
-    before = invite_cache.get(guild.id, {}).copy()
+    _invite_pending_joins[guild.id] = _invite_pending_joins.get(guild.id, 0) + 1
     try:
-        invites_now = await fetch_guild_invites_safe(guild)
-    except Exception:
-        invites_now = []
-    used_inviter_id = None
-    after_map = {inv.code: (inv.uses or 0, inv) for inv in invites_now}
-    for code, (uses_after, inv_obj) in after_map.items():
-        prev = before.get(code, 0)
-        if uses_after > prev:
-            used_inviter_id = inv_obj.inviter.id if inv_obj.inviter else None
-            break
-    invite_cache[guild.id] = {code: uses for code, (uses, inv) in after_map.items()}
-    member_inviter[guild.id][member.id] = used_inviter_id
+        async with guild_lock(_invite_fetch_locks, guild.id):
+            used_inviter_id = None
+            baseline = invite_cache.get(guild.id)
+            if baseline is None:
+                # Warm-up hasn't reached this guild yet: with no baseline any invite with uses
+                # would look "used", so seed it from this snapshot and leave the join unattributed
+                invites_now = await fetch_guild_invites_safe(guild)
+                if invites_now is not None:
+                    _invite_fetch_cache[guild.id] = (time.monotonic(), invites_now)
+                    invite_cache[guild.id] = {inv.code: inv.uses or 0 for inv in invites_now}
+            else:
+                fetched_at, invites_now = _invite_fetch_cache.get(guild.id, (0.0, []))
+                used = None
+                if time.monotonic() - fetched_at < INVITE_SNAPSHOT_TTL:
+                    used = _first_unattributed_invite(invites_now, baseline)
+                fresh = used is None
+                if fresh:
+                    invites_now = await fetch_guild_invites_safe(guild)
+                    if invites_now is not None:
+                        _invite_fetch_cache[guild.id] = (time.monotonic(), invites_now)
+                        used = _first_unattributed_invite(invites_now, baseline)
+                if used is not None:
+                    baseline[used.code] = baseline.get(used.code, 0) + 1
+                    used_inviter_id = used.inviter.id if used.inviter else None
+                # Nobody else is waiting on this snapshot: resync so stale deltas don't linger.
+                # A failed fetch leaves the baseline alone and the join unattributed.
+                if fresh and invites_now is not None and _invite_pending_joins[guild.id] <= 1:
+                    invite_cache[guild.id] = {inv.code: inv.uses or 0 for inv in invites_now}
+    finally:
+        _invite_pending_joins[guild.id] -= 1
+    inviters = member_inviter.get(guild.id)
+    if inviters is None:
+        inviters = member_inviter[guild.id] = LRUDict(on_evict=partial(forget_tracked_join, guild.id))
+    # A rejoin replaces the earlier attribution; don't leave it indexed under the old inviter
+    unindex_invitee(guild.id, member.id, inviters.get(member.id))
+    inviters[member.id] = used_inviter_id
+    db_write("INSERT OR REPLACE INTO inviter VALUES (?, ?, ?)", (guild.id, member.id, used_inviter_id))
     if used_inviter_id:
-        inviter_index[used_inviter_id].add(member.id)
+        inviter_index.setdefault((guild.id, used_inviter_id), set()).add(member.id)
     return used_inviter_id
 
+async def warm_guild_caches():
+    sem = asyncio.Semaphore(GUILD_REFRESH_CONCURRENCY)
+
+    async def _one(g: discord.Guild):
+        async with sem:
+            try:
+                await cache_invites_for_guild(g)
+                await cache_bans_for_guild(g)
+            except Exception as e:
+                log.warning("[WARMUP] Refresh failed for %s: %s", g.name, e)
+
+    await asyncio.gather(*(_one(g) for g in bot.guilds), return_exceptions=True)
+
 # ---------------------------
 # Flagging & alerts
 # ---------------------------
-async def flag_member_and_alert(guild: discord.Guild, member: discord.Member, reason: str):
-    flagged_accounts[guild.id][member.id] = reason
-    try:
-        await broadcast_to_some_channels(guild, f"⚠️ THIS ACCOUNT IS LIKELY AN ALT ACCOUNT OF {reason} — TAKE PRECAUTION ⚠️", max_channels=JOIN_WARNING_MAX_CHANNELS)
-    except Exception:
-        pass
-    try:
-        await member.send(f"⚠️ You were flagged as a possible alt account: {reason}\nContact staff if this is a mistake.")
-    except Exception:
-        pass
+async def _safe_dm(user: Optional[discord.abc.User], text: str):
+    """DM `user` if there is one, swallowing failures such as closed DMs."""
+    if user is None:
+        return
     try:
-        if guild.owner:
-            await guild.owner.send(f"Alert: {member} in {guild.name} was flagged: {reason}")
+        await user.send(text)
     except Exception:
         pass
+
+async def get_guild_owner(guild: discord.Guild) -> Optional[discord.abc.User]:
+    # guild.owner is usually uncached (members cache only holds joins), so remember the fetch
+    owner = guild.owner or _guild_owners.get(guild.id)
+    if owner is not None and owner.id == guild.owner_id:
+        return owner
     try:
-        owner = await bot.fetch_user(BOT_OWNER_ID)
-        await owner.send(f"Alert: {member} in {guild.name} flagged: {reason}")
-    except Exception:
-        pass
+        owner = _guild_owners[guild.id] = await bot.fetch_user(guild.owner_id)
+    except discord.HTTPException as e:
+        log.warning("[OWNER] Could not fetch owner of %s: %s", guild.name, e)
+        return None
+    return owner
+
+async def flag_member_and_alert(guild: discord.Guild, member: discord.Member, reason: str,
+                                channel_alert: bool = True, guild_owner: Optional[discord.abc.User] = None):
+    flagged = flagged_accounts.get(guild.id)
+    if flagged is None:
+        flagged = flagged_accounts[guild.id] = LRUDict()
+    ts = time.time()
+    flagged[member.id] = (ts, reason)
+    db_write("INSERT OR REPLACE INTO flagged VALUES (?, ?, ?, ?)", (guild.id, member.id, reason, ts))
+    if channel_alert:
+        try:
+            await send_guild_alert(guild, f"⚠️ THIS ACCOUNT IS LIKELY AN ALT ACCOUNT OF {reason} — TAKE PRECAUTION ⚠️")
+        except Exception:
+            pass
+    # Member, guild owner and bot owner are independent; a slow DM shouldn't hold up the others
+    await asyncio.gather(
+        _rl(_safe_dm(member, f"⚠️ You were flagged as a possible alt account: {reason}\nContact staff if this is a mistake.")),
+        _rl(_safe_dm(guild_owner or await get_guild_owner(guild), f"Alert: {member} in {guild.name} was flagged: {reason}")),
+        _rl(send_to_bot_owner(f"Alert: {member} in {guild.name} flagged: {reason}")),
+    )
+
+async def resolve_guild_members(guild: discord.Guild, member_ids) -> List[discord.Member]:
+    """
+    Members for `member_ids`, from the cache where possible. The member cache only holds
+    members seen this session, so the rest (e.g. invitees loaded from the DB) are fetched;
+    NotFound means they left and they're dropped.
+    """
+    members, missing = [], []
+    for mid in member_ids:
+        m = guild.get_member(mid)
+        if m:
+            members.append(m)
+        else:
+            missing.append(mid)
+    if missing:
+        sem = asyncio.Semaphore(GUILD_REFRESH_CONCURRENCY)
+
+        async def _fetch(mid: int) -> Optional[discord.Member]:
+            async with sem:
+                try:
+                    return await _rl(guild.fetch_member(mid))
+                except discord.NotFound:
+                    return None
+                except discord.HTTPException as e:
+                    log.warning("[FLAG] Could not fetch member %s in %s: %s", mid, guild.name, e)
+                    return None
+
+        members.extend(m for m in await asyncio.gather(*(_fetch(mid) for mid in missing)) if m)
+    return members
 
 async def mark_inviter_banned_and_flag_invitees(guild: discord.Guild, banned_user_id: int):
-    if banned_user_id in banned_inviters[guild.id]:
+    banned = banned_inviters.setdefault(guild.id, set())
+    if banned_user_id in banned:
         return
-    banned_inviters[guild.id].add(banned_user_id)
-    invited = inviter_index.get(banned_user_id, set())
-    for mid in invited:
-        m = guild.get_member(mid)
-        if m:
-            await flag_member_and_alert(guild, m, f"Invited by banned user <@{banned_user_id}>")
+    banned.add(banned_user_id)
+    db_write("INSERT OR IGNORE INTO banned VALUES (?, ?)", (guild.id, banned_user_id))
+    # Snapshot: joins recorded while we await alerts below would otherwise mutate the set mid-iteration
+    invited = tuple(inviter_index.get((guild.id, banned_user_id), ()))
+    reason = f"Invited by banned user <@{banned_user_id}>"
+    # Members already flagged (e.g. by another banned inviter) were alerted on once already
+    flagged = flagged_accounts.get(guild.id, {})
+    members = await resolve_guild_members(guild, [mid for mid in invited if mid not in flagged])
+    if not members:
+        return
+    # Resolved once here; concurrent flags would otherwise each miss the cache and fetch it
+    guild_owner = await get_guild_owner(guild)
+    if len(members) == 1:
+        await flag_member_and_alert(guild, members[0], reason, guild_owner=guild_owner)
+        return
+    # Many invitees: one summary post to the guild instead of one alert per account
+    await asyncio.gather(*(flag_member_and_alert(guild, m, reason, channel_alert=False, guild_owner=guild_owner)
+                           for m in members), return_exceptions=True)
+    header = f"⚠️ {len(members)} ACCOUNTS ARE LIKELY ALT ACCOUNTS — {reason} — TAKE PRECAUTION ⚠️\n"
+    mentions = " ".join(m.mention for m in members)
+    if len(header) + len(mentions) > 2000:
+        mentions = mentions[:2000 - len(header) - 20].rsplit(" ", 1)[0] + " …and more"
+    try:
+        await send_guild_alert(guild, header + mentions)
+    except Exception:
+        pass
 
 # ---------------------------
 # Anti-raid
 # ---------------------------
 async def record_join_and_maybe_kick(guild: discord.Guild, member: discord.Member):
-    ts = now_utc()
-    join_log[guild.id].append((ts, member.id))
-    window = timedelta(seconds=RAID_WINDOW_SECONDS)
-    while join_log[guild.id] and (ts - join_log[guild.id][0][0] > window):
-        join_log[guild.id].popleft()
-    if len(join_log[guild.id]) > RAID_THRESHOLD_JOINS:
-        to_kick = [mid for (t, mid) in join_log[guild.id] if (ts - t) <= window]
-        safe_print(f"[RAID] Detected raid in {guild.name}: kicking {len(to_kick)} accounts.")
-        for uid in to_kick:
-            m = guild.get_member(uid)
-            if m:
-                try:
-                    await m.kick(reason=f"Raid prevention: {len(to_kick)} joins in {RAID_WINDOW_SECONDS}s")
-                    safe_print(f"[RAID] Kicked {m} in {guild.name}")
-                except Exception as e:
-                    safe_print(f"[RAID] Could not kick {m} in {guild.name}: {e}")
-        join_log[guild.id].clear()
+    ts = time.monotonic()
+    lock = guild_lock(_raid_locks, guild.id)
+    # One raid check (and kick wave) per guild at a time; concurrent joins queue here
+    async with lock:
+        dq = join_log.get(guild.id)
+        if dq is None:
+            dq = join_log[guild.id] = deque(maxlen=JOIN_LOG_MAXLEN)
+        dq.append((ts, member.id))
+        # Below the threshold there can't be a raid, so stale entries can wait
+        if len(dq) > RAID_THRESHOLD_JOINS:
+            cutoff = ts - RAID_WINDOW_SECONDS
+            popleft = dq.popleft
+            while dq and dq[0][0] < cutoff:
+                popleft()
+        if len(dq) > RAID_THRESHOLD_JOINS:
+            # Everything left after pruning is inside the window; take it and reset
+            to_kick = [mid for (_, mid) in dq]
+            dq.clear()
+            log.info("[RAID] Detected raid in %s: kicking %s accounts.", guild.name, len(to_kick))
+            reason = f"Raid prevention: {len(to_kick)} joins in {RAID_WINDOW_SECONDS}s"
+            sem = asyncio.Semaphore(RAID_KICK_CONCURRENCY)
+
+            async def _kick(m: discord.Member):
+                async with sem:
+                    try:
+                        await _rl(m.kick(reason=reason))
+                        log.debug("[RAID] Kicked %s in %s", m, guild.name)
+                    except Exception as e:
+                        log.warning("[RAID] Could not kick %s in %s: %s", m, guild.name, e)
+
+            members = [m for m in map(guild.get_member, to_kick) if m]
+            await asyncio.gather(*(_kick(m) for m in members), return_exceptions=True)
 
 # ---------------------------
 # Events
 # ---------------------------
 @bot.event
 async def on_ready():
-    safe_print(f"[READY] Logged in as {bot.user} ({bot.user.id})")
+    log.info("[READY] Logged in as %s (%s)", bot.user, bot.user.id)
     try:
         await start_keepalive()
     except Exception as e:
-        safe_print(f"[KEEPALIVE] Start failed: {e}")
-    for g in bot.guilds:
-        try:
-            await cache_invites_for_guild(g)
-        except Exception:
-            pass
+        log.error("[KEEPALIVE] Start failed: %s", e)
+    await get_bot_owner()
+    # Sync first so slash commands are live while per-guild caches warm up
     try:
         await tree.sync()
-        safe_print("[SLASH] Commands synced.")
+        log.info("[SLASH] Commands synced.")
     except Exception:
         pass
+    started = time.monotonic()
+    await warm_guild_caches()
+    log.info("[READY] Warmed caches for %s guilds in %.2fs", len(bot.guilds), time.monotonic() - started)
     if not periodic_enforcer.is_running():
         periodic_enforcer.start()
+    if not sweep_expired_flags.is_running():
+        sweep_expired_flags.start()
 
 @bot.event
 async def on_guild_join(guild: discord.Guild):
-    safe_print(f"[GUILD] Joined {guild.name}")
+    log.info("[GUILD] Joined %s", guild.name)
     await cache_invites_for_guild(guild)
+    await cache_bans_for_guild(guild)
+
+@bot.event
+async def on_guild_remove(guild: discord.Guild):
+    sendable_channels.pop(guild.id, None)
+    _guild_owners.pop(guild.id, None)
+
+@bot.event
+async def on_guild_channel_create(channel: discord.abc.GuildChannel):
+    sendable_channels.pop(channel.guild.id, None)
+
+@bot.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel):
+    sendable_channels.pop(channel.guild.id, None)
+
+@bot.event
+async def on_guild_channel_update(before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+    sendable_channels.pop(after.guild.id, None)
+
+@bot.event
+async def on_guild_role_create(role: discord.Role):
+    sendable_channels.pop(role.guild.id, None)
+
+@bot.event
+async def on_guild_role_delete(role: discord.Role):
+    # Deleting one of our roles changes our permissions without an on_member_update
+    sendable_channels.pop(role.guild.id, None)
+
+@bot.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    sendable_channels.pop(after.guild.id, None)
+
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    # Our own role set decides channel access too
+    if after.id == bot.user.id and before.roles != after.roles:
+        sendable_channels.pop(after.guild.id, None)
 
 @bot.event
 async def on_invite_create(invite: discord.Invite):
-    await cache_invites_for_guild(invite.guild)
+    # Only patch an existing baseline; creating a partial one would defeat the no-baseline guard
+    baseline = invite_cache.get(invite.guild.id)
+    if baseline is not None:
+        baseline[invite.code] = invite.uses or 0
+    mark_invite_snapshot_dirty(invite.guild.id)
 
 @bot.event
 async def on_invite_delete(invite: discord.Invite):
-    await cache_invites_for_guild(invite.guild)
+    invite_cache.get(invite.guild.id, {}).pop(invite.code, None)
+    mark_invite_snapshot_dirty(invite.guild.id)
 
 @bot.event
 async def on_member_join(member: discord.Member):
     guild = member.guild
     await record_join_and_maybe_kick(guild, member)
     inviter_id = await detect_used_invite_and_record_inviter(member)
-    if inviter_id and inviter_id in banned_inviters[guild.id]:
+    if inviter_id and inviter_id in banned_inviters.get(guild.id, ()):
         await flag_member_and_alert(guild, member, f"Invited by banned user <@{inviter_id}>")
 
 @bot.event
 async def on_member_ban(guild: discord.Guild, user: discord.User):
     await mark_inviter_banned_and_flag_invitees(guild, user.id)
 
+@bot.event
+async def on_member_unban(guild: discord.Guild, user: discord.User):
+    banned_inviters.get(guild.id, set()).discard(user.id)
+    db_write("DELETE FROM banned WHERE guild = ? AND user = ?", (guild.id, user.id))
+
 # ---------------------------
 # Periodic enforcer
 # ---------------------------
@@ -431,41 +881,93 @@ async def periodic_enforcer():
                 continue
             await attempt_dataset_role_or_fallback(guild, target_member)
         except Exception as e:
-            safe_print(f"[ENFORCE] Error in {guild.name}: {e}\n{traceback.format_exc()}")
+            log.exception("[ENFORCE] Error in %s: %s", guild.name, e)
 
 @periodic_enforcer.before_loop
 async def before_enforcer():
     await bot.wait_until_ready()
 
+# ---------------------------
+# Flag expiry
+# ---------------------------
+@tasks.loop(hours=1)
+async def sweep_expired_flags():
+    cutoff = time.time() - FLAGGED_TTL_DAYS * 86400
+    dropped = 0
+    for flagged in flagged_accounts.values():
+        stale = [mid for mid, (ts, _) in flagged.items() if ts < cutoff]
+        for mid in stale:
+            del flagged[mid]
+        dropped += len(stale)
+    if dropped:
+        db_write("DELETE FROM flagged WHERE ts < ?", (cutoff,))
+        log.info("[FLAGS] Expired %s flags older than %s days", dropped, FLAGGED_TTL_DAYS)
+
 # ---------------------------
 # Slash commands: utilities & fun
 # ---------------------------
-def is_owner_or_admin(interaction: discord.Interaction) -> bool:
-    try:
-        return interaction.user.id == BOT_OWNER_ID or interaction.user.guild_permissions.administrator
-    except Exception:
-        return False
+TRACKER_PAGE_SIZE = 25
+
+def render_tracker_page(guild: discord.Guild, entries: List[Tuple[int, int]], page: int) -> discord.Embed:
+    pages = max(1, math.ceil(len(entries) / TRACKER_PAGE_SIZE))
+    start = page * TRACKER_PAGE_SIZE
+    description = "\n".join([f"<@{mid}> — invited by <@{inviter}>" for mid, inviter in entries[start:start + TRACKER_PAGE_SIZE]])
+    embed = discord.Embed(title=f"Invite Tracker — {guild.name}", description=description, color=discord.Color.blurple())
+    embed.set_footer(text=f"Page {page + 1}/{pages} — {len(entries)} tracked joins")
+    return embed
+
+class TrackerPager(discord.ui.View):
+    """Prev/next buttons that re-render one page of /tracker in place."""
+
+    def __init__(self, guild: discord.Guild, entries: List[Tuple[int, int]]):
+        super().__init__(timeout=180)
+        self.guild = guild
+        self.entries = entries
+        self.page = 0
+        self.pages = max(1, math.ceil(len(entries) / TRACKER_PAGE_SIZE))
+        self.message: Optional[discord.WebhookMessage] = None  # set by /tracker once sent
+        self._sync_buttons()
+
+    def _sync_buttons(self):
+        self.prev_page.disabled = self.page <= 0
+        self.next_page.disabled = self.page >= self.pages - 1
+
+    async def _show(self, interaction: discord.Interaction):
+        self._sync_buttons()
+        await interaction.response.edit_message(embed=render_tracker_page(self.guild, self.entries, self.page), view=self)
+
+    async def on_timeout(self):
+        # Expired buttons would otherwise stay clickable and fail with "This interaction failed"
+        self.prev_page.disabled = True
+        self.next_page.disabled = True
+        if self.message is not None:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+
+    @discord.ui.button(label="◀ Prev", style=discord.ButtonStyle.secondary)
+    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = max(self.page - 1, 0)
+        await self._show(interaction)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = min(self.page + 1, self.pages - 1)
+        await self._show(interaction)
 
 @tree.command(name="tracker", description="Show members and who invited them.")
 async def tracker_cmd(interaction: discord.Interaction):
-    await interaction.response.defer(thinking=True)
+    await interaction.response.defer(ephemeral=True, thinking=True)
     guild = interaction.guild
     if not guild:
-        return await interaction.followup.send("Use in a server.")
-    lines = []
-    inviters = member_inviter.get(guild.id, {})
-    for m in sorted(guild.members, key=lambda x: (x.joined_at or now_utc())):
-        inviter = inviters.get(m.id)
-        inv_text = f"<@{inviter}>" if inviter else "Unknown"
-        lines.append(f"{m.mention} — invited by {inv_text}")
-    if not lines:
-        return await interaction.followup.send("No invite data.")
-    if len(lines) > 40:
-        content = "\n".join(lines)
-        await interaction.followup.send(file=discord.File(fp=bytes(content.encode("utf-8")), filename=f"invite_tracker_{guild.id}.txt"))
-    else:
-        embed = discord.Embed(title=f"Invite Tracker — {guild.name}", description="\n".join(lines), color=discord.Color.blurple())
-        await interaction.followup.send(embed=embed)
+        return await interaction.followup.send("Use in a server.", ephemeral=True)
+    # Only joins with a known inviter, in join order; pages render lazily
+    entries = [(mid, inv) for mid, inv in member_inviter.get(guild.id, {}).items() if inv]
+    if not entries:
+        return await interaction.followup.send("No invite data.", ephemeral=True)
+    view = TrackerPager(guild, entries)
+    view.message = await interaction.followup.send(embed=render_tracker_page(guild, entries, 0), view=view, ephemeral=True)
 
 @tree.command(name="showalts", description="Show flagged accounts likely to be alts.")
 async def showalts_cmd(interaction: discord.Interaction):
@@ -476,16 +978,11 @@ async def showalts_cmd(interaction: discord.Interaction):
     flagged = flagged_accounts.get(guild.id, {})
     if not flagged:
         return await interaction.followup.send("No flagged accounts.")
-    lines = []
-    for mid, reason in flagged.items():
-        m = guild.get_member(mid)
-        if m:
-            lines.append(f"{m.mention} — {reason}")
-        else:
-            lines.append(f"<@{mid}> — {reason} (may have left)")
+    # By ID: the member cache only holds this session's joins, so a cache miss says nothing about leaving
+    lines = [f"<@{mid}> — {reason}" for mid, (_, reason) in flagged.items()]
     if len(lines) > 40:
         content = "\n".join(lines)
-        await interaction.followup.send(file=discord.File(fp=bytes(content.encode("utf-8")), filename=f"flagged_{guild.id}.txt"))
+        await interaction.followup.send(file=discord.File(fp=io.BytesIO(content.encode("utf-8")), filename=f"flagged_{guild.id}.txt"))
     else:
         embed = discord.Embed(title=f"Flagged Accounts — {guild.name}", description="\n".join(lines), color=discord.Color.orange())
         await interaction.followup.send(embed=embed)
@@ -516,39 +1013,39 @@ async def userinfo_cmd(interaction: discord.Interaction, user: Optional[discord.
     embed.add_field(name="Roles", value=", ".join(roles) if roles else "None", inline=False)
     await interaction.response.send_message(embed=embed)
 
+_RPS_CHOICES = ("rock", "paper", "scissors")
+_RPS_WINS = frozenset({("rock", "scissors"), ("scissors", "paper"), ("paper", "rock")})
+
 @tree.command(name="rps", description="Rock-paper-scissors.")
 @app_commands.describe(choice="rock|paper|scissors")
 async def rps_cmd(interaction: discord.Interaction, choice: str):
     c = choice.lower().strip()
-    if c not in {"rock","paper","scissors"}:
+    if c not in _RPS_CHOICES:
         return await interaction.response.send_message("Choose rock, paper, or scissors.")
-    bot_choice = random.choice(["rock","paper","scissors"])
+    bot_choice = random.choice(_RPS_CHOICES)
     if c == bot_choice:
         result = "Tie!"
-    elif (c, bot_choice) in {("rock","scissors"),("scissors","paper"),("paper","rock")}:
+    elif (c, bot_choice) in _RPS_WINS:
         result = "You win!"
     else:
         result = "You lose!"
     await interaction.response.send_message(f"You: **{c}**\nBot: **{bot_choice}**\n**{result}**")
 
+# Digit runs are bounded by the configured limits, so int() never sees a huge string
+# (it raises past ~4300 digits) and any in-limit spec still matches
+_DICE_RE = re.compile(rf"(\d{{0,{len(str(MAX_ROLL_COUNT))}}})d(\d{{1,{len(str(MAX_ROLL_SIDES))}}})")
+
 @tree.command(name="roll", description="Roll dice (e.g., 2d6 or d20).")
 @app_commands.describe(spec="Format XdY or dY")
 async def roll_cmd(interaction: discord.Interaction, spec: str):
-    s = spec.lower().strip()
-    try:
-        if s.startswith("d"):
-            count = 1
-            sides = int(s[1:])
-        else:
-            parts = s.split("d")
-            if len(parts) != 2:
-                raise ValueError()
-            count = int(parts[0]); sides = int(parts[1])
-    except Exception:
+    m = _DICE_RE.fullmatch(spec.lower().strip())
+    if not m:
         return await interaction.response.send_message("Format must be like `2d6` or `d20`.")
+    count = int(m.group(1) or 1)
+    sides = int(m.group(2))
     if count < 1 or count > MAX_ROLL_COUNT or sides < 1 or sides > MAX_ROLL_SIDES:
         return await interaction.response.send_message(f"Limits: up to {MAX_ROLL_COUNT} dice and {MAX_ROLL_SIDES} sides.")
-    rolls = [random.randint(1,sides) for _ in range(count)]
+    rolls = random.choices(range(1, sides + 1), k=count)
     await interaction.response.send_message(f"🎲 Rolls: {rolls}\nTotal: **{sum(rolls)}**")
 
 @tree.command(name="ascii", description="Simple ASCII stylizer.")
@@ -556,7 +1053,7 @@ async def roll_cmd(interaction: discord.Interaction, spec: str):
 async def ascii_cmd(interaction: discord.Interaction, text: str):
     if not text or len(text) > 60:
         return await interaction.response.send_message("Provide text up to 60 characters.")
-    out = " ".join(list(text))
+    out = " ".join(text)
     art = out + "\n" + ("-" * max(2, len(text)*2))
     await interaction.response.send_message(f"```\n{art}\n```")
 
@@ -564,19 +1061,18 @@ async def ascii_cmd(interaction: discord.Interaction, text: str):
 async def meme_cmd(interaction: discord.Interaction):
     await interaction.response.defer()
     try:
-        async with aiohttp.ClientSession(timeout=ClientTimeout(total=10)) as sess:
-            async with sess.get(MEME_API_URL) as r:
-                if r.status == 200:
-                    data = await r.json()
-                    title = data.get("title", "Meme")
-                    url = data.get("url")
-                    post = data.get("postLink")
-                    embed = discord.Embed(title=title, url=post, color=discord.Color.random())
-                    if url:
-                        embed.set_image(url=url)
-                    await interaction.followup.send(embed=embed)
-                else:
-                    await interaction.followup.send("Meme API error.")
+        async with HTTP.get(MEME_API_URL) as r:
+            if r.status == 200:
+                data = await r.json()
+                title = data.get("title", "Meme")
+                url = data.get("url")
+                post = data.get("postLink")
+                embed = discord.Embed(title=title, url=post, color=discord.Color.random())
+                if url:
+                    embed.set_image(url=url)
+                await interaction.followup.send(embed=embed)
+            else:
+                await interaction.followup.send("Meme API error.")
     except Exception:
         await interaction.followup.send("Failed to fetch meme.")
 
@@ -588,29 +1084,42 @@ async def translate_cmd(interaction: discord.Interaction, text: str, target_lang
     if LIBRETRANSLATE_API_KEY:
         payload["api_key"] = LIBRETRANSLATE_API_KEY
     try:
-        async with aiohttp.ClientSession(timeout=ClientTimeout(total=12)) as sess:
-            async with sess.post(LIBRETRANSLATE_URL, data=payload) as r:
-                if r.status == 200:
-                    data = await r.json()
-                    translated = data.get("translatedText", "(no translation)")
-                    await interaction.followup.send(f"**Translation ({target_lang})**:\n{translated}")
-                else:
-                    await interaction.followup.send("Translation service returned error.")
+        async with HTTP.post(LIBRETRANSLATE_URL, data=payload) as r:
+            if r.status == 200:
+                data = await r.json()
+                translated = data.get("translatedText", "(no translation)")
+                await interaction.followup.send(f"**Translation ({target_lang})**:\n{translated}", allowed_mentions=_NO_MENTIONS)
+            else:
+                await interaction.followup.send("Translation service returned error.")
     except Exception:
         await interaction.followup.send("Translation service unreachable.")
 
 # Owner-only commands
-def owner_check(interaction: discord.Interaction) -> bool:
+def is_owner_or_admin(interaction: discord.Interaction) -> bool:
     try:
         return interaction.user.id == BOT_OWNER_ID or interaction.user.guild_permissions.administrator
     except Exception:
         return False
 
+# Rejected at dispatch, before the command body runs; the reply comes from on_app_command_error
+owner_only = app_commands.check(is_owner_or_admin)
+
+@tree.error
+async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, app_commands.CheckFailure):
+        send = interaction.followup.send if interaction.response.is_done() else interaction.response.send_message
+        try:
+            await send("Not authorized.", ephemeral=True)
+        except discord.HTTPException:
+            pass
+        return
+    name = interaction.command.name if interaction.command else "?"
+    log.error("[SLASH] /%s failed", name, exc_info=error)
+
 @tree.command(name="say", description="[Owner] Make the bot say a message.")
+@owner_only
 @app_commands.describe(message="Message to send")
 async def say_cmd(interaction: discord.Interaction, message: str):
-    if not owner_check(interaction):
-        return await interaction.response.send_message("Not authorized.", ephemeral=True)
     await interaction.response.send_message("Sent.", ephemeral=True)
     try:
         await interaction.channel.send(message)
@@ -618,10 +1127,9 @@ async def say_cmd(interaction: discord.Interaction, message: str):
         pass
 
 @tree.command(name="purge", description="[Owner] Delete messages.")
+@owner_only
 @app_commands.describe(amount="1-200")
 async def purge_cmd(interaction: discord.Interaction, amount: int):
-    if not owner_check(interaction):
-        return await interaction.response.send_message("Not authorized.", ephemeral=True)
     if amount < 1 or amount > 200:
         return await interaction.response.send_message("Amount must be 1-200.", ephemeral=True)
     await interaction.response.defer(ephemeral=True)
@@ -632,32 +1140,31 @@ async def purge_cmd(interaction: discord.Interaction, amount: int):
         await interaction.followup.send("Purge failed.", ephemeral=True)
 
 @tree.command(name="servers", description="[Owner] List servers the bot is in.")
+@owner_only
 async def servers_cmd(interaction: discord.Interaction):
-    if not owner_check(interaction):
-        return await interaction.response.send_message("Not authorized.", ephemeral=True)
-    lines = [f"{g.name} ({g.id}) — {len(g.members)} members" for g in bot.guilds]
+    lines = [f"{g.name} ({g.id}) — {g.member_count} members" for g in bot.guilds]
     await interaction.response.send_message("```\n" + "\n".join(lines) + "\n```", ephemeral=True)
 
 @tree.command(name="shutdown", description="[Owner] Shutdown the bot.")
+@owner_only
 async def shutdown_cmd(interaction: discord.Interaction):
-    if not owner_check(interaction):
-        return await interaction.response.send_message("Not authorized.", ephemeral=True)
     await interaction.response.send_message("Shutting down...", ephemeral=True)
     await asyncio.sleep(1)
     await bot.close()
 
 @tree.command(name="dm", description="[Owner] Send a DM to a user.")
+@owner_only
 @app_commands.describe(user="User to DM", message="Message text")
 async def dm_cmd(interaction: discord.Interaction, user: discord.User, message: str):
-    if not owner_check(interaction):
-        return await interaction.response.send_message("Not authorized.", ephemeral=True)
+    # Ack before the DM round trip so a slow send can't outlive the 3s interaction window
+    await interaction.response.defer(ephemeral=True)
     try:
         await user.send(message)
-        await interaction.response.send_message("DM sent.", ephemeral=True)
+        await interaction.followup.send("DM sent.", ephemeral=True)
     except discord.Forbidden:
-        await interaction.response.send_message("User has DMs disabled.", ephemeral=True)
+        await interaction.followup.send("User has DMs disabled.", ephemeral=True)
     except Exception:
-        await interaction.response.send_message("Failed to send DM.", ephemeral=True)
+        await interaction.followup.send("Failed to send DM.", ephemeral=True)
 
 # ---------------------------
 # New: /massdm - owner-only, multiple recipients
@@ -705,14 +1212,13 @@ def parse_users_field(users_field: str) -> List[int]:
     return out
 
 @tree.command(name="massdm", description="[Owner] Send a DM to multiple users. Users: mention(s) or IDs separated by spaces or commas.")
+@owner_only
 @app_commands.describe(users="Space- or comma-separated mentions or IDs", message="Message to send")
 async def massdm_cmd(interaction: discord.Interaction, users: str, message: str):
     """
     Owner-only command: parse the users string and DM each resolved user with the same message.
     Replies ephemeral to the invoker with summary (success/fail counts).
     """
-    if not owner_check(interaction):
-        return await interaction.response.send_message("Not authorized.", ephemeral=True)
     # Parse the users field to get user IDs
     user_ids = parse_users_field(users)
     if not user_ids:
@@ -748,7 +1254,7 @@ async def massdm_cmd(interaction: discord.Interaction, users: str, message: str)
     if len(details) > 30:
         content = "\n".join(details)
         fname = f"massdm_result_{int(time.time())}.txt"
-        await interaction.followup.send(content=summary, file=discord.File(fp=bytes(content.encode("utf-8")), filename=fname), ephemeral=True)
+        await interaction.followup.send(content=summary, file=discord.File(fp=io.BytesIO(content.encode("utf-8")), filename=fname), ephemeral=True)
     else:
         await interaction.followup.send(content=summary + "\n" + "\n".join(details), ephemeral=True)
 
@@ -759,12 +1265,8 @@ async def forward_dm_to_owner_and_channels(author: discord.User, content: str, a
     header = f"**DM from {author} ({author.id})**\n"
     text_body = header + (content or "(no text)")
     if FORWARD_TO_OWNER_DM:
-        try:
-            owner = await bot.fetch_user(BOT_OWNER_ID)
-            if owner:
-                await owner.send(text_body)
-        except Exception:
-            safe_print("[DM-FWD] Failed to forward DM to owner")
+        if not await send_to_bot_owner(text_body):
+            log.error("[DM-FWD] Failed to forward DM to owner")
     for gid, cid in DM_LOG_CHANNELS.items():
         try:
             g = bot.get_guild(gid)
@@ -777,9 +1279,9 @@ async def forward_dm_to_owner_and_channels(author: discord.User, content: str, a
                         embed = discord.Embed(description=text_body, color=discord.Color.dark_gold(), timestamp=datetime.now(UTC))
                         for a in attachments:
                             embed.add_field(name="Attachment", value=a.url, inline=False)
-                        await ch.send(embed=embed)
+                        await ch.send(embed=embed, allowed_mentions=_NO_MENTIONS)
                     else:
-                        await ch.send(text_body)
+                        await ch.send(text_body, allowed_mentions=_NO_MENTIONS)
                 except Exception:
                     pass
         except Exception:
@@ -797,7 +1299,7 @@ async def on_message(message: discord.Message):
         try:
             await forward_dm_to_owner_and_channels(message.author, content, attachments)
         except Exception as e:
-            safe_print(f"[DM] Forward error: {e}")
+            log.error("[DM] Forward error: %s", e)
         try:
             await message.add_reaction("✅")
         except Exception:
@@ -809,16 +1311,37 @@ async def on_message(message: discord.Message):
 # Boot / run
 # ---------------------------
 async def main():
-    safe_print("[BOOT] Starting Raid Preventor Bot (with /massdm).")
-    safe_print(f"  TARGET_USERNAME={TARGET_USERNAME} TARGET_USER_ID={TARGET_USER_ID}")
-    safe_print(f"  SCAN_INTERVAL={SCAN_INTERVAL} RAID_WINDOW={RAID_WINDOW_SECONDS}s THRESHOLD={RAID_THRESHOLD_JOINS}")
-    safe_print(f"  PORT={PORT} ROLE_ASSIGNMENTS entries={len(ROLE_ASSIGNMENTS)} DM_LOG_CHANNELS entries={len(DM_LOG_CHANNELS)}")
-    await bot.start(DISCORD_TOKEN)
+    log.info("[BOOT] Starting Raid Preventor Bot (with /massdm).")
+    log.info("  TARGET_USERNAME=%s TARGET_USER_ID=%s", TARGET_USERNAME, TARGET_USER_ID)
+    log.info("  SCAN_INTERVAL=%s RAID_WINDOW=%ss THRESHOLD=%s", SCAN_INTERVAL, RAID_WINDOW_SECONDS, RAID_THRESHOLD_JOINS)
+    log.info("  PORT=%s ROLE_ASSIGNMENTS entries=%s DM_LOG_CHANNELS entries=%s", PORT, len(ROLE_ASSIGNMENTS), len(DM_LOG_CHANNELS))
+    try:
+        db_open()
+        load_persisted_state()
+    except sqlite3.Error as e:
+        log.error("[DB] Could not open %s, state will not persist: %s", STATE_DB_PATH, e)
+    global HTTP
+    HTTP = aiohttp.ClientSession(
+        timeout=ClientTimeout(total=15, connect=5, sock_read=10),
+        connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300),
+    )
+    try:
+        await bot.start(DISCORD_TOKEN)
+    finally:
+        await HTTP.close()
+        db_flush()
 
 if __name__ == "__main__":
+    try:
+        import uvloop  # optional: faster event loop on Linux/macOS
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        safe_print("[STOP] KeyboardInterrupt, exiting.")
+        log.info("[STOP] KeyboardInterrupt, exiting.")
     except Exception as e:
-        safe_print(f"[ERROR] Unhandled exception: {e}\n{traceback.format_exc()}")
+        log.exception("[ERROR] Unhandled exception: %s", e)
+    finally:
+        _log_listener.stop()
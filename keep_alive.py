@@ -1,18 +0,0 @@
-from flask import Flask
-from threading import Thread
-import os
-
-app = Flask(__name__)
-
-@app.route("/")
-def home():
-    return "Bot is alive!"
-
-def run():
-    # Render requires binding to the dynamic $PORT value
-    port = int(os.environ.get("PORT", 8080))
-    app.run(host="0.0.0.0", port=port)
-
-def keep_alive():
-    t = Thread(target=run)
-    t.start()